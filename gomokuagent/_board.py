@@ -0,0 +1,103 @@
+"""Board kernels for AdvancedLLMAgent's analysis and fallback search.
+
+Plain, fully annotated Python so the module can be compiled ahead of time
+with mypyc (see setup.py); the agents import it the same way either way.
+
+Bitboards pack cell (r, c) into bit r * stride + c, where stride is one
+more than the board width. The spare column is always empty, so shifted
+bitboards cannot wrap a line from one row onto the next.
+"""
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple
+
+
+class BoardShape(NamedTuple):
+    """Bitboard constants for one board size, computed once per size."""
+    rows: int
+    cols: int
+    stride: int
+    shifts: Tuple[int, int, int, int]  # horizontal, vertical, diagonal, anti-diagonal
+    cells: int                         # mask of every on-board cell
+    neighbours: Tuple[int, ...]        # per square, mask of the 8 surrounding cells
+
+
+@lru_cache(maxsize=None)
+def board_shape(rows: int, cols: int) -> BoardShape:
+    """Return the cached bitboard constants for a rows x cols board."""
+    stride = cols + 1
+    shifts = (1, stride, stride + 1, stride - 1)
+    row_mask = (1 << cols) - 1
+    cells = 0
+    for r in range(rows):
+        cells |= row_mask << (r * stride)
+
+    neighbours = []
+    for square in range(rows * stride):
+        bit = 1 << square
+        mask = 0
+        for shift in shifts:
+            mask |= (bit << shift) | (bit >> shift)
+        neighbours.append(mask & cells)
+    return BoardShape(rows, cols, stride, shifts, cells, tuple(neighbours))
+
+
+def count_sequences(stones: int, shape: BoardShape, length: int) -> int:
+    """Count sequences of a given length for a player."""
+    # Every maximal run of at least `length` stones along a direction
+    # contains exactly one cell whose run to the line's end is `length`
+    # long, so counting the starts of such runs is enough.
+    count = 0
+    for shift in shape.shifts:
+        runs = stones
+        for k in range(1, length):
+            runs &= stones >> (k * shift)
+        count += bin(runs & ~(stones << shift)).count("1")
+    return count
+
+
+def empty_moves(occupied: int, shape: BoardShape) -> List[Tuple[int, int]]:
+    """List empty cells in row-major order straight from the bitboards."""
+    empty = shape.cells & ~occupied
+    stride = shape.stride
+    moves = []
+    while empty:
+        low = empty & -empty  # isolate the lowest set bit
+        square = low.bit_length() - 1
+        moves.append((square // stride, square % stride))
+        empty ^= low
+    return moves
+
+
+def _has_five(stones: int, shift: int) -> bool:
+    run = stones & (stones >> shift)  # 2 in a row
+    run &= run >> (2 * shift)         # 4 in a row
+    return bool(run & (stones >> (4 * shift)))  # 5 in a row
+
+
+def creates_five_in_row(player_bb: int, occupied: int, shape: BoardShape, move: Tuple[int, int]) -> bool:
+    """Check if a move creates five in a row."""
+    row, col = move
+    bit = 1 << (row * shape.stride + col)
+    if occupied & bit:
+        return False
+
+    stones = player_bb | bit
+    horizontal, vertical, diagonal, anti_diagonal = shape.shifts
+    return (_has_five(stones, horizontal) or _has_five(stones, vertical)
+            or _has_five(stones, diagonal) or _has_five(stones, anti_diagonal))
+
+
+def evaluate_move(occupied: int, shape: BoardShape, move: Tuple[int, int]) -> float:
+    """Evaluate a move's tactical value."""
+    row, col = move
+    score = 0.0
+
+    # Prefer center
+    center_distance = abs(row - 3.5) + abs(col - 3.5)
+    score += max(0.0, 7 - center_distance)
+
+    # Prefer moves near existing pieces
+    neighbours = shape.neighbours[row * shape.stride + col]
+    score += 2 * bin(occupied & neighbours).count("1")
+
+    return score
@@ -0,0 +1,324 @@
+"""Shared request path for the agents' LLM calls."""
+import asyncio
+import hashlib
+import inspect
+import json
+import re
+from collections import OrderedDict
+
+from gomoku.llm import OpenAIGomokuClient
+from gomoku.core.models import Player
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# By default, opening moves go to the faster model and the rest of the game
+# to the stronger one.
+_ENDPOINT = "https://api.groq.com/openai/v1"
+_STRONG_MODEL = "gemma2-9b-it"
+_FAST_MODEL = "llama-3.1-8b-instant"
+_FAST_MODEL_MOVES = 6
+
+# Seconds AdvancedLLMAgent waits for the LLM before playing its positional move.
+LLM_TIMEOUT = 1.5
+
+# Upper bound on remembered (board, player) -> move answers per agent.
+_MOVE_CACHE_SIZE = 10_000
+
+# Cap on concurrent requests per event loop, across all agents.
+_MAX_INFLIGHT = 64
+
+# Board cell -> character used in prompts; anything else is an empty cell.
+CELL_CHARS = {Player.X: "X", Player.O: "O"}
+
+# One level of nested braces; only used when the brace scanner finds no object.
+_JSON_RE = re.compile(r"\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}", re.DOTALL)
+
+# (api_key, model, endpoint) -> number of open GroqClient handles using it
+_config_refs = {}
+
+# (api_key, model, endpoint) -> client built by GroqClient() but not yet used on a loop
+_idle_clients = {}
+
+# event loop -> _LoopState, removed again when the loop shuts down
+_loop_state = {}
+
+
+class _LoopState:
+    """Per-event-loop request limit, in-flight requests and shared clients.
+
+    Clients live here rather than process-wide because their async HTTP pool
+    belongs to the loop it first ran on; a harness that plays each game under
+    its own asyncio.run() gets fresh clients for every loop, and they are
+    closed when that loop shuts down.
+    """
+    __slots__ = ("semaphore", "inflight", "clients", "watcher")
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(_MAX_INFLIGHT)
+        self.inflight = {}
+        self.clients = {}
+        self.watcher = None
+
+
+async def _watch_loop(loop, state):
+    # Parked at the yield until loop.shutdown_asyncgens() closes it, which
+    # asyncio.run() does once the main coroutine is done; the finally block
+    # then still runs on the loop and can await the clients' close.
+    try:
+        yield
+    finally:
+        if _loop_state.get(loop) is state:
+            del _loop_state[loop]
+        clients = list(state.clients.values())
+        state.clients.clear()
+        for client in clients:
+            await aclose(client)
+
+
+async def _state_for(loop):
+    state = _loop_state.get(loop)
+    if state is None:
+        # Loops closed without shutdown_asyncgens() never ran their watcher;
+        # their clients can no longer be awaited, so just forget them.
+        for closed in [other for other in _loop_state if other.is_closed()]:
+            del _loop_state[closed]
+        state = _LoopState()
+        _loop_state[loop] = state
+        # Keep a reference so the watcher is only finalized at loop shutdown.
+        state.watcher = _watch_loop(loop, state)
+        await state.watcher.asend(None)
+    return state
+
+
+def _build_client(config):
+    api_key, model, endpoint = config
+    return OpenAIGomokuClient(api_key=api_key, model=model, endpoint=endpoint)
+
+
+def _client_for(state, config):
+    client = state.clients.get(config)
+    if client is None:
+        client = _idle_clients.pop(config, None) or _build_client(config)
+        state.clients[config] = client
+    return client
+
+
+async def _run(semaphore, client, messages, kwargs):
+    async with semaphore:
+        return await client.complete(messages, **kwargs)
+
+
+class _Pending:
+    """An in-flight request and the number of callers still waiting on it."""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+def _forget(inflight, key, pending):
+    def callback(task):
+        if inflight.get(key) is pending:
+            del inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved even if every waiter left early.
+    return callback
+
+
+async def submit(config, messages, **kwargs) -> str:
+    """Send a chat completion, coalescing identical requests already in flight.
+
+    ``config`` is an (api_key, model, endpoint) tuple; every caller with the
+    same config on the running loop shares one client and connection pool.
+    Agents in the same tournament or self-play run often ask about the same
+    position at once; those callers share one HTTP round-trip. The request is
+    cancelled once every caller has given up on it (say after a timeout), so
+    a retry goes back to the network instead of joining it. At most
+    ``_MAX_INFLIGHT`` requests run concurrently per event loop.
+    """
+    state = await _state_for(asyncio.get_running_loop())
+    inflight = state.inflight
+    key = (config, json.dumps(messages, sort_keys=True), json.dumps(kwargs, sort_keys=True))
+
+    pending = inflight.get(key)
+    if pending is None:
+        client = _client_for(state, config)
+        pending = _Pending(asyncio.ensure_future(_run(state.semaphore, client, messages, kwargs)))
+        inflight[key] = pending
+        pending.task.add_done_callback(_forget(inflight, key, pending))
+
+    pending.waiters += 1
+    try:
+        # Shield so one caller cancelling does not cancel the request for the others.
+        return await asyncio.shield(pending.task)
+    finally:
+        pending.waiters -= 1
+        if not pending.waiters and not pending.task.done():
+            pending.task.cancel()
+            if inflight.get(key) is pending:
+                del inflight[key]
+
+
+def request_options(system_prompt: str) -> dict:
+    """Extra complete() arguments that tag requests with a prompt cache key.
+
+    The system prompt never changes between moves, so providers with prefix
+    caching can reuse it; everything move-specific goes in the user message.
+    Only a complete() with an ``extra_body`` parameter can forward the key.
+    The current OpenAIGomokuClient.complete(messages) has none, so for it
+    this returns no options and requests go out unchanged.
+    """
+    if "extra_body" not in inspect.signature(OpenAIGomokuClient.complete).parameters:
+        return {}
+    cache_key = hashlib.sha1(system_prompt.encode()).hexdigest()
+    return {"extra_body": {"prompt_cache_key": cache_key}}
+
+
+async def aclose(client):
+    """Release a client's pooled HTTP connections, if it exposes a way to."""
+    close = getattr(client, "aclose", None) or getattr(client, "close", None)
+    if close is None:
+        return
+    result = close()
+    if inspect.isawaitable(result):
+        await result
+
+
+class GroqClient:
+    """An agent's access to the Groq models, choosing one for each move.
+
+    Moves before ``fast_model_moves`` go to the faster model and the rest to
+    the stronger one; pass 0 to always use the stronger model. Handles with
+    the same API key share the underlying clients. Each handle counts as one
+    user of them until close(); closing the last user of a model's client
+    closes it on the running loop.
+    """
+
+    def __init__(self, api_key: str, system_prompt: str, fast_model_moves: int = _FAST_MODEL_MOVES):
+        self._fast = (api_key, _FAST_MODEL, _ENDPOINT)
+        self._strong = (api_key, _STRONG_MODEL, _ENDPOINT)
+        self._fast_model_moves = fast_model_moves
+        self._configs = (self._fast, self._strong) if fast_model_moves > 0 else (self._strong,)
+        self._options = request_options(system_prompt)
+        # Build the clients now so a bad key or endpoint fails here, where the
+        # agents switch to their fallback mode, rather than on every move.
+        # The first loop to send a request adopts them.
+        built = {config: _build_client(config) for config in self._configs if config not in _idle_clients}
+        _idle_clients.update(built)
+        self._closed = False
+        for config in self._configs:
+            _config_refs[config] = _config_refs.get(config, 0) + 1
+
+    async def complete(self, messages, move_count: int) -> str:
+        """Ask the fast model during the opening and the strong one afterwards."""
+        config = self._fast if move_count < self._fast_model_moves else self._strong
+        return await submit(config, messages, **self._options)
+
+    async def close(self):
+        """Give up this handle, closing any client it was the last user of.
+
+        Such a client is closed right away if no loop has used it yet or it
+        belongs to the running loop, and scheduled for closing on loops
+        running in other threads. On a loop that is not
+        running it is left for that loop's shutdown to close.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        current_loop = asyncio.get_running_loop()
+        for config in self._configs:
+            _config_refs[config] -= 1
+            if _config_refs[config]:
+                continue
+            del _config_refs[config]
+            idle = _idle_clients.pop(config, None)
+            if idle is not None:
+                await aclose(idle)
+            for loop, state in list(_loop_state.items()):
+                if loop is not current_loop and not loop.is_running():
+                    continue
+                client = state.clients.pop(config, None)
+                if client is None:
+                    continue
+                if loop is current_loop:
+                    await aclose(client)
+                else:
+                    asyncio.run_coroutine_threadsafe(aclose(client), loop)
+
+
+class MoveCache:
+    """LRU map from a position (board, player to move) to the LLM's answer."""
+
+    def __init__(self, size: int = _MOVE_CACHE_SIZE):
+        self.size = size
+        self._moves = OrderedDict()
+
+    @staticmethod
+    def key(game_state):
+        """Encode the position as hashable (board bytes, player to move)."""
+        cells = bytes(
+            1 if cell == Player.X else 2 if cell == Player.O else 0
+            for row in game_state.board
+            for cell in row
+        )
+        return cells, game_state.current_player.value
+
+    def get(self, key, game_state):
+        """Return the remembered move if it is still legal in this game, else None."""
+        move = self._moves.get(key)
+        if move is None or not game_state.is_valid_move(*move):
+            return None
+        self._moves.move_to_end(key)
+        return move
+
+    def put(self, key, move):
+        """Store an LLM answer, evicting the least recently used entry when full."""
+        self._moves[key] = move
+        self._moves.move_to_end(key)
+        if len(self._moves) > self.size:
+            self._moves.popitem(last=False)
+
+
+def extract_json(text: str):
+    """Return the first balanced ``{...}`` block in an LLM response, or None.
+
+    Walks the text once tracking brace depth. Braces inside JSON strings are
+    ignored, honouring backslash escapes; quotes in the prose around the
+    object are not treated as strings. If the scan never closes an object
+    (say a stray ``{`` in the prose), fall back to a nested-brace regex.
+    """
+    depth = 0
+    start = 0
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = depth > 0
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    if match := _JSON_RE.search(text):
+        return match.group(0)
+    return None
+
+
+def parse_json(text: str):
+    """Decode a JSON object, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
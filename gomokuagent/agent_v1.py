@@ -1,12 +1,12 @@
-import re
-import json
 import random
 import asyncio
-from typing import Tuple
+import sys
+from typing import Tuple, Optional
 from gomoku import Agent
-from gomoku.llm import OpenAIGomokuClient
 from gomoku.core.models import Player, GameState
 
+from . import _llm
+
 # Add this if userdata is from Colab
 try:
     from google.colab import userdata
@@ -17,37 +17,7 @@ except ImportError:
         def get(key):
             return os.environ.get(key)
 
-class StudentLLMAgent(Agent):
-    """An educational LLM agent that students will build step by step."""
-
-    def __init__(self, agent_id: str):
-        super().__init__(agent_id)
-        self._setup()
-        print(f"🎓 Created StudentLLMAgent: {agent_id}")
-
-    def _setup(self):
-        """Setup our LLM client and prompts."""
-        self.system_prompt = self._create_system_prompt()
-
-        try:
-            api_key = userdata.get('Groq_API_l1')  # Fixed to match your actual key name
-            if not api_key:
-                print("WARNING: Groq_API_l1 not found, using fallback mode")
-                self.llm_client = None
-                return
-                
-            self.llm_client = OpenAIGomokuClient(
-                api_key=api_key,
-                model="gemma2-9b-it",
-                endpoint="https://api.groq.com/openai/v1",
-            )
-        except Exception as e:
-            print(f"Error setting up LLM client: {e}")
-            self.llm_client = None
-
-    def _create_system_prompt(self) -> str:
-        """Create the system prompt that teaches the LLM how to play Gomoku."""
-        return """
+_SYSTEM_PROMPT_V1 = sys.intern("""
 You are a MASTER Gomoku player with perfect strategic vision. You play on an 8x8 board where 5-in-a-row wins.
 
 CRITICAL ANALYSIS FRAMEWORK - Always follow this order:
@@ -80,7 +50,42 @@ RESPONSE FORMAT - You MUST respond with valid JSON:
     "row": <number>,
     "col": <number>
 }
-""".strip()
+""".strip())
+
+class StudentLLMAgent(Agent):
+    """An educational LLM agent that students will build step by step."""
+
+    def __init__(self, agent_id: str):
+        super().__init__(agent_id)
+        self._setup()
+        print(f"🎓 Created StudentLLMAgent: {agent_id}")
+
+    def _setup(self):
+        """Setup our LLM client and prompts."""
+        self.system_prompt = self._create_system_prompt()
+        self._move_cache = _llm.MoveCache()
+
+        try:
+            api_key = userdata.get('Groq_API_l1')  # Fixed to match your actual key name
+            if not api_key:
+                print("WARNING: Groq_API_l1 not found, using fallback mode")
+                self.llm_client = None
+                return
+                
+            self.llm_client = _llm.GroqClient(api_key, self.system_prompt)
+        except Exception as e:
+            print(f"Error setting up LLM client: {e}")
+            self.llm_client = None
+
+    async def close(self):
+        """Release this agent's share of the LLM clients when it is retired."""
+        if self.llm_client:
+            await self.llm_client.close()
+            self.llm_client = None
+
+    def _create_system_prompt(self) -> str:
+        """Create the system prompt that teaches the LLM how to play Gomoku."""
+        return _SYSTEM_PROMPT_V1
 
     async def get_move(self, game_state: GameState) -> Tuple[int, int]:
         """Main method: Get the next move from our LLM."""
@@ -91,24 +96,29 @@ RESPONSE FORMAT - You MUST respond with valid JSON:
             print("No LLM client available, using random move")
             return self._get_fallback_move(game_state)
 
+        cache_key = self._move_cache.key(game_state)
+        cached_move = self._move_cache.get(cache_key, game_state)
+        if cached_move is not None:
+            print(f"Cached move: {cached_move}")
+            return cached_move
+
+        move = await self._ask_llm(game_state, cache_key)
+        if move is not None:
+            return move
+        return self._get_fallback_move(game_state)
+
+    async def _ask_llm(self, game_state: GameState, cache_key) -> Optional[Tuple[int, int]]:
+        """Ask the LLM for a move; None if it fails or answers with an invalid move."""
         try:
             board_str = self._create_board_representation(game_state)
             
-            # Add game context
             move_count = len(game_state.move_history)
             
-            # Create comprehensive prompt
-            user_prompt = f"""
-CURRENT GAME SITUATION:
-{board_str}
-
-GAME CONTEXT:
-- Move #{move_count + 1}
-- You are player: {game_state.current_player.value}
-- Legal moves available: {len(game_state.get_legal_moves())}
-
-Apply the strategic framework step by step and provide your best move as JSON.
-"""
+            # Fixed wording first so it extends the cached system-prompt prefix;
+            # the board already shows every stone, so no move list or counts.
+            user_prompt = f"""Apply the strategic framework step by step and provide your best move as JSON.
+You are player {game_state.current_player.value}. Move #{move_count + 1}:
+{board_str}"""
 
             messages = [
                 {"role": "system", "content": self.system_prompt},
@@ -116,38 +126,30 @@ Apply the strategic framework step by step and provide your best move as JSON.
             ]
 
             print("Prompt Being Sent...")
-            response = await self.llm_client.complete(messages)
+            response = await self.llm_client.complete(messages, move_count)
             print(f"LLM Response: {response}")
 
             # Extract JSON
-            if match := re.search(r"\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}", response, re.DOTALL):
-                json_data = json.loads(match.group(0).strip())
+            if json_text := _llm.extract_json(response):
+                json_data = _llm.parse_json(json_text)
                 row, col = json_data["row"], json_data["col"]
                 
                 if game_state.is_valid_move(row, col):
                     print(f"AI chose: ({row}, {col})")
+                    self._move_cache.put(cache_key, (row, col))
                     return (row, col)
 
         except Exception as e:
             print(f"Error: {e}")
 
-        return self._get_fallback_move(game_state)
+        return None
 
     def _create_board_representation(self, game_state: GameState) -> str:
         """Create a string representation of the board."""
-        # This is a placeholder - implement based on your GameState structure
-        board = game_state.board
-        board_str = ""
-        for i in range(len(board)):
-            for j in range(len(board[i])):
-                if board[i][j] == Player.X:
-                    board_str += "X "
-                elif board[i][j] == Player.O:
-                    board_str += "O "
-                else:
-                    board_str += ". "
-            board_str += "\n"
-        return board_str
+        return "".join(
+            " ".join(_llm.CELL_CHARS.get(cell, ".") for cell in row) + " \n"
+            for row in game_state.board
+        )
 
     def _get_fallback_move(self, game_state: GameState) -> Tuple[int, int]:
         """Simple fallback when LLM fails."""
@@ -1,12 +1,12 @@
-import re
-import json
 import random
 import asyncio
-from typing import Tuple, List
+import sys
+from typing import Tuple, List, Optional
 from gomoku import Agent
-from gomoku.llm import OpenAIGomokuClient
 from gomoku.core.models import Player, GameState
 
+from . import _board, _llm
+
 try:
     from google.colab import userdata
 except ImportError:
@@ -16,37 +16,7 @@ except ImportError:
         def get(key):
             return os.environ.get(key)
 
-class AdvancedLLMAgent(Agent):
-    """An improved LLM agent with better strategic prompting and fallback logic."""
-
-    def __init__(self, agent_id: str):
-        super().__init__(agent_id)
-        self._setup()
-        print(f"🚀 Created AdvancedLLMAgent: {agent_id}")
-
-    def _setup(self):
-        """Setup our LLM client and prompts."""
-        self.system_prompt = self._create_advanced_system_prompt()
-
-        try:
-            api_key = userdata.get('Groq_API_l1')
-            if not api_key:
-                print("WARNING: Groq_API_l1 not found, using strategic fallback mode")
-                self.llm_client = None
-                return
-                
-            self.llm_client = OpenAIGomokuClient(
-                api_key=api_key,
-                model="gemma2-9b-it",
-                endpoint="https://api.groq.com/openai/v1",
-            )
-        except Exception as e:
-            print(f"Error setting up LLM client: {e}")
-            self.llm_client = None
-
-    def _create_advanced_system_prompt(self) -> str:
-        """Create an advanced system prompt with better strategic guidance."""
-        return """
+_SYSTEM_PROMPT_V2 = sys.intern("""
 You are an EXPERT Gomoku strategist with deep tactical knowledge. You play on an 8x8 board where 5-in-a-row wins.
 
 PRIORITY SYSTEM (Check in this exact order):
@@ -93,7 +63,46 @@ You must respond with this exact JSON format:
 }
 
 Think like a grandmaster: Every move should either threaten victory or prevent defeat while improving your position.
-""".strip()
+""".strip())
+
+class AdvancedLLMAgent(Agent):
+    """An improved LLM agent with better strategic prompting and fallback logic."""
+
+    CENTER_MOVES = [(3, 3), (3, 4), (4, 3), (4, 4)]
+
+    def __init__(self, agent_id: str):
+        super().__init__(agent_id)
+        self._setup()
+        print(f"🚀 Created AdvancedLLMAgent: {agent_id}")
+
+    def _setup(self):
+        """Setup our LLM client and prompts."""
+        self.system_prompt = self._create_advanced_system_prompt()
+        self._move_cache = _llm.MoveCache()
+
+        try:
+            api_key = userdata.get('Groq_API_l1')
+            if not api_key:
+                print("WARNING: Groq_API_l1 not found, using strategic fallback mode")
+                self.llm_client = None
+                return
+                
+            # Openings and quiet positions are answered locally, so every question
+            # that reaches the LLM is tactical: always use the stronger model.
+            self.llm_client = _llm.GroqClient(api_key, self.system_prompt, fast_model_moves=0)
+        except Exception as e:
+            print(f"Error setting up LLM client: {e}")
+            self.llm_client = None
+
+    async def close(self):
+        """Release this agent's share of the LLM clients when it is retired."""
+        if self.llm_client:
+            await self.llm_client.close()
+            self.llm_client = None
+
+    def _create_advanced_system_prompt(self) -> str:
+        """Create an advanced system prompt with better strategic guidance."""
+        return _SYSTEM_PROMPT_V2
 
     async def get_move(self, game_state: GameState) -> Tuple[int, int]:
         """Main method: Get the next move from our advanced LLM."""
@@ -104,9 +113,46 @@ Think like a grandmaster: Every move should either threaten victory or prevent d
             print("Using advanced strategic fallback")
             return self._get_strategic_move(game_state)
 
+        packed = self._pack(game_state.board)
+        counts = self._sequence_counts(game_state, packed)
+        local_move = self._get_local_move(game_state, packed, counts)
+        if local_move is not None:
+            return local_move
+
+        cache_key = self._move_cache.key(game_state)
+        cached_move = self._move_cache.get(cache_key, game_state)
+        if cached_move is not None:
+            print(f"Cached move: {cached_move}")
+            return cached_move
+
+        # Work out the local answer while waiting, so a slow or failed LLM call
+        # costs at most _llm.LLM_TIMEOUT seconds. _get_local_move already ruled out
+        # a win or block, so only the positional choice is left.
+        llm_task = asyncio.ensure_future(self._ask_llm(game_state, counts, cache_key))
+        fallback_task = asyncio.ensure_future(
+            asyncio.to_thread(self._choose_positional_move, packed)
+        )
+        try:
+            done, _ = await asyncio.wait({llm_task}, timeout=_llm.LLM_TIMEOUT)
+            if llm_task in done and (move := llm_task.result()) is not None:
+                return move
+
+            if not done:
+                print(f"⏱️ LLM gave no answer within {_llm.LLM_TIMEOUT}s")
+            move, note = await fallback_task
+            print(note)
+            return move
+        finally:
+            # Also reached when the caller cancels get_move itself.
+            for task in (llm_task, fallback_task):
+                if not task.done():
+                    task.cancel()
+
+    async def _ask_llm(self, game_state: GameState, counts, cache_key) -> Optional[Tuple[int, int]]:
+        """Ask the LLM for a move; None if it fails or answers with an invalid move."""
         try:
             board_str = self._create_detailed_board_representation(game_state)
-            analysis = self._analyze_position(game_state)
+            analysis = self._analyze_position(counts)
             
             move_count = len(game_state.move_history)
             
@@ -131,33 +177,57 @@ Apply your expert knowledge and provide the best move as JSON.
             ]
 
             print("🧠 Advanced analysis in progress...")
-            response = await self.llm_client.complete(messages)
+            response = await self.llm_client.complete(messages, move_count)
             print(f"💭 LLM Strategy: {response[:100]}...")
 
-            if match := re.search(r"\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}", response, re.DOTALL):
-                json_data = json.loads(match.group(0).strip())
+            if json_text := _llm.extract_json(response):
+                json_data = _llm.parse_json(json_text)
                 row, col = json_data["row"], json_data["col"]
                 
                 if game_state.is_valid_move(row, col):
                     print(f"🎯 Strategic choice: ({row}, {col})")
+                    self._move_cache.put(cache_key, (row, col))
                     return (row, col)
 
         except Exception as e:
             print(f"LLM error: {e}")
 
-        return self._get_strategic_move(game_state)
+        return None
 
-    def _analyze_position(self, game_state: GameState) -> str:
-        """Analyze the current position for threats and opportunities."""
-        board = game_state.board
+    def _get_local_move(self, game_state: GameState, packed, counts) -> Optional[Tuple[int, int]]:
+        """Answer positions that do not need the LLM, or return None to ask it."""
+        forced_move = self._get_forced_move(game_state, packed)
+        if forced_move is not None:
+            return forced_move
+
+        # Each side's first stone goes in the centre
+        if len(game_state.move_history) < 2:
+            for move in self.CENTER_MOVES:
+                if game_state.is_valid_move(*move):
+                    print(f"📍 Opening in center: {move}")
+                    return move
+
+        # Quiet positions with no threes on the board are left to the heuristics
+        my_twos, my_threes, opp_twos, opp_threes = counts
+        if not (my_threes or opp_threes):
+            return self._get_positional_move(packed)
+        return None
+
+    def _sequence_counts(self, game_state: GameState, packed):
+        """Count twos and threes for the player to move and the opponent."""
+        bitboards, shape, occupied = packed
         my_player = game_state.current_player
         opp_player = Player.O if my_player == Player.X else Player.X
-        
-        # Count sequences
-        my_twos = self._count_sequences(board, my_player, 2)
-        my_threes = self._count_sequences(board, my_player, 3)
-        opp_twos = self._count_sequences(board, opp_player, 2)
-        opp_threes = self._count_sequences(board, opp_player, 3)
+        return (
+            _board.count_sequences(bitboards[my_player], shape, 2),
+            _board.count_sequences(bitboards[my_player], shape, 3),
+            _board.count_sequences(bitboards[opp_player], shape, 2),
+            _board.count_sequences(bitboards[opp_player], shape, 3),
+        )
+
+    def _analyze_position(self, counts) -> str:
+        """Analyze the current position for threats and opportunities."""
+        my_twos, my_threes, opp_twos, opp_threes = counts
         
         return f"""
 My position: {my_threes} threes, {my_twos} twos
@@ -165,129 +235,83 @@ Opponent position: {opp_threes} threes, {opp_twos} twos
 Tactical balance: {'Attacking' if my_threes > opp_threes else 'Defending' if opp_threes > my_threes else 'Equal'}
 """
 
-    def _count_sequences(self, board, player, length):
-        """Count sequences of a given length for a player."""
-        # Simplified implementation - you could make this more sophisticated
-        count = 0
-        directions = [(0,1), (1,0), (1,1), (1,-1)]
-        
-        for row in range(len(board)):
-            for col in range(len(board[0])):
-                for dr, dc in directions:
-                    sequence = 0
-                    r, c = row, col
-                    while (0 <= r < len(board) and 0 <= c < len(board[0]) and 
-                           board[r][c] == player):
-                        sequence += 1
-                        r, c = r + dr, c + dc
-                    if sequence == length:
-                        count += 1
-        return count
-
     def _create_detailed_board_representation(self, game_state: GameState) -> str:
         """Create a detailed string representation of the board."""
-        board = game_state.board
-        result = "  0 1 2 3 4 5 6 7\n"
-        for i in range(len(board)):
-            result += f"{i} "
-            for j in range(len(board[i])):
-                if board[i][j] == Player.X:
-                    result += "X "
-                elif board[i][j] == Player.O:
-                    result += "O "
-                else:
-                    result += ". "
-            result += "\n"
-        return result
+        rows = [
+            f"{i} " + " ".join(_llm.CELL_CHARS.get(cell, ".") for cell in row) + " \n"
+            for i, row in enumerate(game_state.board)
+        ]
+        return "  0 1 2 3 4 5 6 7\n" + "".join(rows)
 
     def _get_strategic_move(self, game_state: GameState) -> Tuple[int, int]:
         """Advanced fallback strategy when LLM is unavailable."""
-        legal_moves = game_state.get_legal_moves()
-        board = game_state.board
-        my_player = game_state.current_player
+        packed = self._pack(game_state.board)
         
-        # 1. Check for immediate wins
-        for move in legal_moves:
-            if self._creates_five_in_row(board, move, my_player):
-                print(f"🏆 Winning move found: {move}")
-                return move
+        # 1-2. Win immediately or block the opponent's win
+        forced_move = self._get_forced_move(game_state, packed)
+        if forced_move is not None:
+            return forced_move
         
-        # 2. Block opponent wins
-        opp_player = Player.O if my_player == Player.X else Player.X
-        for move in legal_moves:
-            if self._creates_five_in_row(board, move, opp_player):
-                print(f"🛡️ Blocking opponent win: {move}")
-                return move
+        # 3-4. Nothing forced: play on position
+        return self._get_positional_move(packed)
+
+    def _get_positional_move(self, packed) -> Tuple[int, int]:
+        """Pick a move on positional grounds once no win or block is pending."""
+        move, note = self._choose_positional_move(packed)
+        print(note)
+        return move
+
+    def _choose_positional_move(self, packed):
+        """Return (move, log line) for the positional choice, without printing.
+
+        Safe to run in a worker thread whose answer may be thrown away.
+        """
+        bitboards, shape, occupied = packed
         
         # 3. Play center if available
-        center_moves = [(3, 3), (3, 4), (4, 3), (4, 4)]
-        for move in center_moves:
-            if move in legal_moves:
-                print(f"📍 Taking center: {move}")
-                return move
+        for row, col in self.CENTER_MOVES:
+            if not occupied >> (row * shape.stride + col) & 1:
+                return (row, col), f"📍 Taking center: {(row, col)}"
         
         # 4. Look for good tactical moves
         scored_moves = []
-        for move in legal_moves:
-            score = self._evaluate_move(board, move, my_player)
+        for move in _board.empty_moves(occupied, shape):
+            score = _board.evaluate_move(occupied, shape, move)
             scored_moves.append((score, move))
         
         scored_moves.sort(reverse=True)
         best_move = scored_moves[0][1]
-        print(f"🎲 Best tactical move: {best_move}")
-        return best_move
-
-    def _creates_five_in_row(self, board, move, player):
-        """Check if a move creates five in a row."""
-        row, col = move
-        if board[row][col] is not None:
-            return False
-            
-        # Simulate the move
-        board[row][col] = player
-        
-        directions = [(0,1), (1,0), (1,1), (1,-1)]
-        for dr, dc in directions:
-            count = 1  # Count the piece we just placed
-            
-            # Count in positive direction
-            r, c = row + dr, col + dc
-            while (0 <= r < len(board) and 0 <= c < len(board[0]) and 
-                   board[r][c] == player):
-                count += 1
-                r, c = r + dr, c + dc
-            
-            # Count in negative direction
-            r, c = row - dr, col - dc
-            while (0 <= r < len(board) and 0 <= c < len(board[0]) and 
-                   board[r][c] == player):
-                count += 1
-                r, c = r - dr, c - dc
-            
-            if count >= 5:
-                board[row][col] = None  # Undo the simulation
-                return True
-        
-        board[row][col] = None  # Undo the simulation
-        return False
+        return best_move, f"🎲 Best tactical move: {best_move}"
 
-    def _evaluate_move(self, board, move, player):
-        """Evaluate a move's tactical value."""
-        row, col = move
-        score = 0
-        
-        # Prefer center
-        center_distance = abs(row - 3.5) + abs(col - 3.5)
-        score += max(0, 7 - center_distance)
+    def _get_forced_move(self, game_state: GameState, packed) -> Optional[Tuple[int, int]]:
+        """Find a move that wins now or blocks the opponent from winning next."""
+        bitboards, shape, occupied = packed
+        my_player = game_state.current_player
+        opp_player = Player.O if my_player == Player.X else Player.X
+        legal_moves = _board.empty_moves(occupied, shape)
         
-        # Prefer moves near existing pieces
-        for dr in [-1, 0, 1]:
-            for dc in [-1, 0, 1]:
-                if dr == 0 and dc == 0:
-                    continue
-                r, c = row + dr, col + dc
-                if (0 <= r < len(board) and 0 <= c < len(board[0]) and 
-                    board[r][c] is not None):
-                    score += 2
+        for move in legal_moves:
+            if _board.creates_five_in_row(bitboards[my_player], occupied, shape, move):
+                print(f"🏆 Winning move found: {move}")
+                return move
         
-        return score
+        for move in legal_moves:
+            if _board.creates_five_in_row(bitboards[opp_player], occupied, shape, move):
+                print(f"🛡️ Blocking opponent win: {move}")
+                return move
+        return None
+
+    def _pack(self, board):
+        """Pack the board into per-player bitboards, in the layout _board expects.
+
+        Returns (bitboards, shape, occupied), computed once per move and passed
+        to every analysis step.
+        """
+        shape = _board.board_shape(len(board), len(board[0]))
+        stride = shape.stride
+        bitboards = {Player.X: 0, Player.O: 0}
+        for r, row in enumerate(board):
+            for c, cell in enumerate(row):
+                if cell in bitboards:
+                    bitboards[cell] |= 1 << (r * stride + c)
+        return bitboards, shape, bitboards[Player.X] | bitboards[Player.O]
@@ -1,12 +1,25 @@
+import os
 from setuptools import setup, find_packages
 
+# Set GOMOKUAGENT_MYPYC=1 to compile the board kernels into a C extension
+# (needs mypy installed at build time); otherwise they run as plain Python.
+ext_modules = []
+if os.environ.get("GOMOKUAGENT_MYPYC"):
+    from mypyc.build import mypycify
+    ext_modules = mypycify(["gomokuagent/_board.py"])
+
 setup(
     name="gomokuagent",
     version="0.1.0",
     packages=find_packages(),
+    ext_modules=ext_modules,
+    python_requires=">=3.9",
     install_requires=[
         "asyncio",
     ],
+    extras_require={
+        "fast": ["orjson"],
+    },
     author="sp",
     description="Custom Gomoku AI Agent",
 )
@@ -0,0 +1,146 @@
+"""Check the bitboard kernels against straightforward board scanners."""
+import random
+import unittest
+
+from gomokuagent import _board
+
+DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+
+def reference_count_sequences(board, player, length):
+    """The original scan: walk forward from every cell in every direction."""
+    rows, cols = len(board), len(board[0])
+    count = 0
+    for row in range(rows):
+        for col in range(cols):
+            for dr, dc in DIRECTIONS:
+                sequence = 0
+                r, c = row, col
+                while 0 <= r < rows and 0 <= c < cols and board[r][c] == player:
+                    sequence += 1
+                    r, c = r + dr, c + dc
+                if sequence == length:
+                    count += 1
+    return count
+
+
+def reference_five_through(board, move, player):
+    """Whether `player` has five in a row through `move` once it is played."""
+    rows, cols = len(board), len(board[0])
+    row, col = move
+    for dr, dc in DIRECTIONS:
+        count = 1
+        for sign in (1, -1):
+            r, c = row + sign * dr, col + sign * dc
+            while 0 <= r < rows and 0 <= c < cols and board[r][c] == player:
+                count += 1
+                r, c = r + sign * dr, c + sign * dc
+        if count >= 5:
+            return True
+    return False
+
+
+def reference_evaluate_move(board, move):
+    row, col = move
+    score = max(0, 7 - (abs(row - 3.5) + abs(col - 3.5)))
+    for dr in (-1, 0, 1):
+        for dc in (-1, 0, 1):
+            r, c = row + dr, col + dc
+            if (dr or dc) and 0 <= r < len(board) and 0 <= c < len(board[0]) and board[r][c] is not None:
+                score += 2
+    return score
+
+
+def pack(board, shape, player):
+    return sum(
+        1 << (r * shape.stride + c)
+        for r, row in enumerate(board)
+        for c, cell in enumerate(row)
+        if cell == player
+    )
+
+
+def random_boards(count, sizes=((8, 8),), seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        rows, cols = rng.choice(sizes)
+        cells = [(r, c) for r in range(rows) for c in range(cols)]
+        board = [[None] * cols for _ in range(rows)]
+        for i, (r, c) in enumerate(rng.sample(cells, rng.randint(0, len(cells) * 3 // 4))):
+            board[r][c] = "X" if i % 2 == 0 else "O"
+        yield board
+
+
+def has_existing_five(board):
+    return any(
+        reference_five_through(board, (r, c), cell)
+        for r, row in enumerate(board)
+        for c, cell in enumerate(row)
+        if cell is not None
+    )
+
+
+class BoardKernelTest(unittest.TestCase):
+
+    def test_count_sequences_matches_reference(self):
+        for board in random_boards(500, sizes=((8, 8), (5, 7), (9, 6))):
+            shape = _board.board_shape(len(board), len(board[0]))
+            for player in "XO":
+                stones = pack(board, shape, player)
+                for length in range(1, 7):
+                    self.assertEqual(
+                        _board.count_sequences(stones, shape, length),
+                        reference_count_sequences(board, player, length),
+                    )
+
+    def test_empty_moves_are_the_empty_cells_in_row_major_order(self):
+        for board in random_boards(200, sizes=((8, 8), (5, 7))):
+            shape = _board.board_shape(len(board), len(board[0]))
+            occupied = pack(board, shape, "X") | pack(board, shape, "O")
+            expected = [
+                (r, c)
+                for r, row in enumerate(board)
+                for c, cell in enumerate(row)
+                if cell is None
+            ]
+            self.assertEqual(_board.empty_moves(occupied, shape), expected)
+
+    def test_creates_five_in_row_matches_reference(self):
+        checked = 0
+        for board in random_boards(1000):
+            if has_existing_five(board):
+                continue  # The game would already be over.
+            shape = _board.board_shape(8, 8)
+            occupied = pack(board, shape, "X") | pack(board, shape, "O")
+            for player in "XO":
+                stones = pack(board, shape, player)
+                for r in range(8):
+                    for c in range(8):
+                        expected = board[r][c] is None and reference_five_through(board, (r, c), player)
+                        self.assertEqual(
+                            _board.creates_five_in_row(stones, occupied, shape, (r, c)),
+                            expected,
+                        )
+            checked += 1
+        self.assertGreater(checked, 500)
+
+    def test_five_does_not_wrap_across_rows(self):
+        shape = _board.board_shape(8, 8)
+        # Three stones at the end of row 0 and one at the start of row 1.
+        stones = pack([["X" if (r, c) in {(0, 5), (0, 6), (0, 7), (1, 0)} else None
+                        for c in range(8)] for r in range(8)], shape, "X")
+        self.assertFalse(_board.creates_five_in_row(stones, stones, shape, (1, 1)))
+
+    def test_evaluate_move_matches_reference(self):
+        for board in random_boards(200):
+            shape = _board.board_shape(8, 8)
+            occupied = pack(board, shape, "X") | pack(board, shape, "O")
+            for move in _board.empty_moves(occupied, shape):
+                self.assertEqual(
+                    _board.evaluate_move(occupied, shape, move),
+                    reference_evaluate_move(board, move),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
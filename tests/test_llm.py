@@ -0,0 +1,334 @@
+"""Check the shared LLM helpers: request path, model choice and response parsing."""
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from gomoku.core.models import Player
+
+from gomokuagent import _llm, agent_v2
+
+
+class ExtractJsonTest(unittest.TestCase):
+
+    def test_object_surrounded_by_prose(self):
+        response = 'Here is my move: {"row": 3, "col": 4} Good luck!'
+        self.assertEqual(_llm.extract_json(response), '{"row": 3, "col": 4}')
+
+    def test_nested_objects_are_kept_whole(self):
+        response = 'Move: {"plan": {"a": {"b": 1}}, "row": 1, "col": 2}.'
+        self.assertEqual(
+            _llm.extract_json(response),
+            '{"plan": {"a": {"b": 1}}, "row": 1, "col": 2}',
+        )
+
+    def test_braces_inside_strings_are_ignored(self):
+        answer = '{"analysis": "block the {X X X} line }", "row": 0, "col": 5}'
+        self.assertEqual(_llm.extract_json("Answer " + answer + " done"), answer)
+
+    def test_escaped_quotes_do_not_end_strings(self):
+        answer = r'{"analysis": "he said \"}\" loudly\\", "row": 2, "col": 2}'
+        self.assertEqual(_llm.extract_json(answer + " {"), answer)
+
+    def test_quotes_in_prose_do_not_start_strings(self):
+        response = 'I "think" this works: {"row": 6, "col": 1}'
+        self.assertEqual(_llm.extract_json(response), '{"row": 6, "col": 1}')
+
+    def test_first_of_several_objects_wins(self):
+        response = '{"row": 1, "col": 1} or maybe {"row": 2, "col": 2}'
+        self.assertEqual(_llm.extract_json(response), '{"row": 1, "col": 1}')
+
+    def test_stray_brace_falls_back_to_regex(self):
+        response = 'Using a { shape here: {"row": 3, "col": 3}'
+        self.assertEqual(_llm.extract_json(response), '{"row": 3, "col": 3}')
+
+    def test_no_object(self):
+        self.assertIsNone(_llm.extract_json("I cannot decide."))
+        self.assertIsNone(_llm.extract_json("unclosed { brace"))
+        self.assertIsNone(_llm.extract_json(""))
+
+    def test_extracted_object_parses(self):
+        answer = _llm.extract_json('ok {"analysis": "a \\"q\\" {x}", "row": 4, "col": 7}')
+        data = _llm.parse_json(answer)
+        self.assertEqual((data["row"], data["col"]), (4, 7))
+        self.assertEqual(data["analysis"], 'a "q" {x}')
+
+
+def position(stones=(), player=Player.X):
+    """A minimal game state: 8x8 board with `stones` as {(row, col): player}."""
+    stones = dict(stones)
+    board = [[None] * 8 for _ in range(8)]
+    for (row, col), stone in stones.items():
+        board[row][col] = stone
+    return SimpleNamespace(
+        board=board,
+        current_player=player,
+        move_history=list(stones),
+        is_valid_move=lambda row, col: 0 <= row < 8 and 0 <= col < 8 and board[row][col] is None,
+    )
+
+
+class MoveCacheTest(unittest.TestCase):
+
+    def test_key_depends_on_board_and_player(self):
+        empty_x = _llm.MoveCache.key(position())
+        self.assertEqual(empty_x, _llm.MoveCache.key(position()))
+        self.assertNotEqual(empty_x, _llm.MoveCache.key(position(player=Player.O)))
+        self.assertNotEqual(empty_x, _llm.MoveCache.key(position({(3, 3): Player.X})))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = _llm.MoveCache(size=2)
+        state = position()
+        cache.put("a", (0, 0))
+        cache.put("b", (1, 1))
+        cache.put("c", (2, 2))
+        self.assertIsNone(cache.get("a", state))
+        self.assertEqual(cache.get("b", state), (1, 1))
+        self.assertEqual(cache.get("c", state), (2, 2))
+
+    def test_get_refreshes_recency(self):
+        cache = _llm.MoveCache(size=2)
+        state = position()
+        cache.put("a", (0, 0))
+        cache.put("b", (1, 1))
+        self.assertEqual(cache.get("a", state), (0, 0))
+        cache.put("c", (2, 2))
+        self.assertEqual(cache.get("a", state), (0, 0))
+        self.assertIsNone(cache.get("b", state))
+
+    def test_move_that_is_no_longer_legal_is_not_returned(self):
+        cache = _llm.MoveCache()
+        cache.put("a", (3, 3))
+        self.assertEqual(cache.get("a", position()), (3, 3))
+        self.assertIsNone(cache.get("a", position({(3, 3): Player.O})))
+
+
+class MessagesOnlyClient:
+    async def complete(self, messages):
+        return ""
+
+
+class ExtraBodyClient:
+    async def complete(self, messages, extra_body=None):
+        return ""
+
+
+class RequestOptionsTest(unittest.TestCase):
+
+    def test_no_options_when_complete_takes_only_messages(self):
+        with mock.patch.object(_llm, "OpenAIGomokuClient", MessagesOnlyClient):
+            self.assertEqual(_llm.request_options("prompt"), {})
+
+    def test_cache_key_when_complete_accepts_extra_body(self):
+        with mock.patch.object(_llm, "OpenAIGomokuClient", ExtraBodyClient):
+            options = _llm.request_options("prompt")
+            self.assertEqual(options, _llm.request_options("prompt"))
+            self.assertNotEqual(options, _llm.request_options("another prompt"))
+        self.assertEqual(list(options), ["extra_body"])
+        self.assertIsInstance(options["extra_body"]["prompt_cache_key"], str)
+
+
+class FakeClient:
+    """Stands in for OpenAIGomokuClient, recording the requests it is sent."""
+    instances = []
+    requests = []
+    delay = 0.0
+    active = peak = cancelled = 0
+
+    def __init__(self, api_key, model, endpoint):
+        if not api_key.startswith("key"):
+            raise ValueError("invalid API key")
+        self.model = model
+        self.closed = False
+        FakeClient.instances.append(self)
+
+    async def complete(self, messages):
+        FakeClient.requests.append((self.model, messages))
+        FakeClient.active += 1
+        FakeClient.peak = max(FakeClient.peak, FakeClient.active)
+        try:
+            await asyncio.sleep(FakeClient.delay)
+        except asyncio.CancelledError:
+            FakeClient.cancelled += 1
+            raise
+        finally:
+            FakeClient.active -= 1
+        return '{"row": 0, "col": 0}'
+
+    async def aclose(self):
+        self.closed = True
+
+
+def user_message(text):
+    return [{"role": "user", "content": text}]
+
+
+def use_fake_client(test):
+    FakeClient.instances = []
+    FakeClient.requests = []
+    FakeClient.delay = 0.0
+    FakeClient.active = FakeClient.peak = FakeClient.cancelled = 0
+    patcher = mock.patch.object(_llm, "OpenAIGomokuClient", FakeClient)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class FakeClientTestCase(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        use_fake_client(self)
+
+
+CONFIG = ("key", "model", "endpoint")
+
+
+class SubmitTest(FakeClientTestCase):
+
+    async def test_identical_concurrent_calls_share_one_request(self):
+        FakeClient.delay = 0.05
+        results = await asyncio.gather(*(_llm.submit(CONFIG, user_message("same")) for _ in range(3)))
+        self.assertEqual(len(FakeClient.requests), 1)
+        self.assertEqual(len(set(results)), 1)
+
+        await asyncio.gather(_llm.submit(CONFIG, user_message("a")), _llm.submit(CONFIG, user_message("b")))
+        self.assertEqual(len(FakeClient.requests), 3)
+
+    async def test_lone_caller_timing_out_cancels_its_request(self):
+        FakeClient.delay = 1.0
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(_llm.submit(CONFIG, user_message("slow")), 0.05)
+        await asyncio.sleep(0)
+        self.assertEqual(FakeClient.cancelled, 1)
+
+        # A retry goes back to the network instead of joining the dead request.
+        FakeClient.delay = 0.0
+        await _llm.submit(CONFIG, user_message("slow"))
+        self.assertEqual(len(FakeClient.requests), 2)
+
+    async def test_joiner_keeps_the_request_when_the_first_caller_leaves(self):
+        FakeClient.delay = 0.1
+        first = asyncio.ensure_future(asyncio.wait_for(_llm.submit(CONFIG, user_message("x")), 0.02))
+        second = asyncio.ensure_future(_llm.submit(CONFIG, user_message("x")))
+        with self.assertRaises(asyncio.TimeoutError):
+            await first
+        self.assertEqual(await second, '{"row": 0, "col": 0}')
+        self.assertEqual(len(FakeClient.requests), 1)
+        self.assertEqual(FakeClient.cancelled, 0)
+
+    async def test_concurrent_requests_are_capped(self):
+        FakeClient.delay = 0.02
+        with mock.patch.object(_llm, "_MAX_INFLIGHT", 2):
+            await asyncio.gather(*(_llm.submit(CONFIG, user_message(str(i))) for i in range(5)))
+        self.assertEqual(len(FakeClient.requests), 5)
+        self.assertEqual(FakeClient.peak, 2)
+
+
+class GroqClientTest(FakeClientTestCase):
+
+    async def test_opening_moves_use_the_fast_model(self):
+        client = _llm.GroqClient("key", "prompt")
+        for move_count in (0, 5, 6, 30):
+            await client.complete(user_message(str(move_count)), move_count)
+        await client.close()
+        self.assertEqual(
+            [model for model, _ in FakeClient.requests],
+            [_llm._FAST_MODEL, _llm._FAST_MODEL, _llm._STRONG_MODEL, _llm._STRONG_MODEL],
+        )
+
+    async def test_no_fast_moves_always_uses_the_strong_model(self):
+        client = _llm.GroqClient("key", "prompt", fast_model_moves=0)
+        await client.complete(user_message("opening"), 0)
+        await client.close()
+        self.assertEqual([model for model, _ in FakeClient.requests], [_llm._STRONG_MODEL])
+
+    async def test_bad_key_fails_when_the_handle_is_created(self):
+        with self.assertRaises(ValueError):
+            _llm.GroqClient("bad", "prompt")
+        self.assertEqual(FakeClient.requests, [])
+
+    async def test_client_built_up_front_is_used_for_requests(self):
+        client = _llm.GroqClient("key", "prompt", fast_model_moves=0)
+        self.assertEqual(len(FakeClient.instances), 1)
+        await client.complete(user_message("move"), 0)
+        self.assertEqual(len(FakeClient.instances), 1)
+        await client.close()
+        self.assertTrue(FakeClient.instances[0].closed)
+
+    async def test_last_close_closes_the_shared_client(self):
+        first = _llm.GroqClient("key", "prompt", fast_model_moves=0)
+        second = _llm.GroqClient("key", "prompt", fast_model_moves=0)
+        await first.complete(user_message("one"), 0)
+        await second.complete(user_message("two"), 0)
+        (shared,) = FakeClient.instances
+        await first.close()
+        await first.close()  # Closing a handle twice only gives it up once.
+        self.assertFalse(shared.closed)
+        await second.close()
+        self.assertTrue(shared.closed)
+
+
+class LoopShutdownTest(unittest.TestCase):
+
+    def setUp(self):
+        use_fake_client(self)
+
+    def test_clients_are_closed_when_their_loop_shuts_down(self):
+        client = _llm.GroqClient("key", "prompt")
+
+        async def game(move_count):
+            await client.complete(user_message("move"), move_count)
+
+        for move_count in (0, 10, 0):
+            asyncio.run(game(move_count))
+        self.assertEqual(len(FakeClient.instances), 3)
+        self.assertTrue(all(fake.closed for fake in FakeClient.instances))
+        self.assertEqual(_llm._loop_state, {})
+        asyncio.run(client.close())
+
+
+class AdvancedAgentTimeoutTest(FakeClientTestCase):
+
+    # X to move with an open three: not forced, so the agent asks the LLM.
+    POSITION = {
+        (3, 3): Player.X, (3, 4): Player.X, (3, 5): Player.X,
+        (7, 0): Player.O, (7, 7): Player.O, (0, 7): Player.O,
+    }
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.object(agent_v2.userdata, "get", return_value="key"),
+            mock.patch.object(agent_v2, "print", create=True),
+            mock.patch.object(_llm, "LLM_TIMEOUT", 0.05),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.agent = agent_v2.AdvancedLLMAgent("test")
+
+    async def asyncTearDown(self):
+        await self.agent.close()
+
+    async def test_answer_in_time_is_played(self):
+        self.assertEqual(await self.agent.get_move(position(self.POSITION)), (0, 0))
+
+    async def test_slow_answer_falls_back_to_a_legal_move(self):
+        FakeClient.delay = 1.0
+        state = position(self.POSITION)
+        move = await asyncio.wait_for(self.agent.get_move(state), 0.5)
+        self.assertTrue(state.is_valid_move(*move))
+        await asyncio.sleep(0)
+        self.assertEqual(FakeClient.cancelled, 1)
+
+    async def test_cancelling_get_move_cancels_the_request(self):
+        FakeClient.delay = 1.0
+        task = asyncio.ensure_future(self.agent.get_move(position(self.POSITION)))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        self.assertEqual(FakeClient.cancelled, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()